@@ -1,7 +1,7 @@
 import streamlit as st
-from utils import GoogleDriveFolder, is_valid_email, is_valid_password, update_observation
-import time, re
-import tempfile
+from utils import GoogleDriveFolder, is_valid_email, is_valid_password, update_observation, build_email_index, get_retry_after, UpdateConflictError
+import time, re, random, io
+from concurrent.futures import ThreadPoolExecutor
 
 #This application allows researchers to upload multiple files, which are then 
 #stored in a dedicated folder assigned to each researcher.
@@ -20,18 +20,37 @@ CREDENTIALS = dict(st.secrets["gcp_service_account"])
 
 PASSWORD = str(st.secrets["app"]["password"])
 
+MAX_UPLOAD_WORKERS = 8
+WORKLIST_FILE = "workListFile.csv"
+WORKLIST_MAX_ATTEMPTS = 3
+_NONALNUM_RE = re.compile(r'[^a-zA-Z0-9]')
+
 # ========================================
 # 🛠️ FUNCTIONS 🛠️
 # ========================================
+# Shared across sessions and reruns so the service is authenticated/built only once per process
+@st.cache_resource
+def get_gdrive():
+    return GoogleDriveFolder(credentials=CREDENTIALS, folder_id=FOLDER_ID)
+
+# Long-lived upload pool shared across sessions: its threads keep their authorized http
+# connections (pydrive2 stores one per thread) alive between submits
+@st.cache_resource
+def get_upload_executor():
+    return ThreadPoolExecutor(max_workers=MAX_UPLOAD_WORKERS, thread_name_prefix="drive-upload")
+
 # Retry Authentication
 def authenticate_with_retries(max_retries=3):
+    delay = 0.2
     for attempt in range(1, max_retries + 1):
         try:
-            st.session_state.gdrive = GoogleDriveFolder(credentials=CREDENTIALS, folder_id=FOLDER_ID)
+            st.session_state.gdrive = get_gdrive()
             return True
         except Exception as e:
             st.warning(f"Authentication failed (Attempt {attempt}/{max_retries}): {e}")
-            time.sleep(2)
+            # Honor the server's Retry-After, otherwise back off exponentially with jitter
+            time.sleep(get_retry_after(e) or delay + random.random() * delay)
+            delay *= 2
     st.error("Failed to authenticate with Google Drive after multiple attempts.")
     return False
 
@@ -47,6 +66,50 @@ def validate_inputs(email, password, files):
     
     return errors  # Returns a list of errors
 
+# Read workListFile, reusing this session's copy while the file on Drive is unchanged
+def read_worklist(gdrive, use_cache=True):
+    modified_date = gdrive.get_file_modified_date(WORKLIST_FILE, FOLDER_ID["DocsToProcess_id"])
+    cached = st.session_state.get("worklist_cache")
+    if use_cache and cached is not None and modified_date is not None and cached[0] == modified_date:
+        return cached[1].copy()
+
+    workListFile = gdrive.read_csv_from_drive(
+        file_name=WORKLIST_FILE, folder_id=FOLDER_ID["DocsToProcess_id"]
+        )
+    if workListFile is not None:
+        st.session_state.worklist_cache = (modified_date, workListFile.copy())
+    return workListFile
+
+# Save the worklist only if nobody changed it since it was read (etag); otherwise re-read it and
+# re-apply this submission, so another writer's updates are never overwritten
+def save_worklist(gdrive, workListFile, worklist_etag, txt_filename, email):
+    for attempt in range(WORKLIST_MAX_ATTEMPTS):
+        try:
+            return gdrive.update_csv_from_df_retry(
+                workListFile, file_name=WORKLIST_FILE, folder_id=FOLDER_ID["DocsToProcess_id"], etag=worklist_etag
+                )
+        except UpdateConflictError:
+            if attempt == WORKLIST_MAX_ATTEMPTS - 1:
+                raise
+            workListFile = read_worklist(gdrive, use_cache=False)
+            worklist_etag = workListFile.attrs.get("etag")
+            _, workListFile = update_observation(workListFile, txt_filename, email, build_email_index(workListFile))
+
+# Queue the upload of a PDF and of its extracted text; both are independent, so they run side by side
+# (worker threads, no Streamlit calls here)
+def submit_uploads(executor, gdrive, file, final_filename, user_folder_id, user_folder_txts):
+    # getvalue() returns the UploadedFile's own bytes and io.BytesIO() wraps them without copying,
+    # so one buffer backs both tasks (getbuffer() would force a copy)
+    pdf_bytes = file.getvalue()
+
+    pdf_future = executor.submit(
+        gdrive.upload_file, io.BytesIO(pdf_bytes), file_name=final_filename, folder_id=user_folder_id
+        )
+    txt_future = executor.submit(
+        gdrive.extract_text_and_upload, pdf_bytes, file_name=final_filename, folder_id=user_folder_txts
+        )
+    return pdf_future, txt_future
+
 # ========================================
 # 📂 STATES 📂
 # ========================================
@@ -72,15 +135,19 @@ st.write("""Este sistema permite cargar un documento PDF, a partir del cuál se
 
 📢 **Notificación**: Una vez que su documento sea procesado, recibirá una copia en el correo electrónico registrado.""", unsafe_allow_html=True)
 
-email = st.text_input("📧 Email")
-password = st.text_input("🔒 Contraseña", type="password")
-files = st.file_uploader("📄 Subir archivos PDF", type=["pdf"], accept_multiple_files=True)
+# Inputs are buffered in a form, so typing does not rerun the script
+with st.form("upload_form"):
+    email = st.text_input("📧 Email")
+    password = st.text_input("🔒 Contraseña", type="password")
+    files = st.file_uploader("📄 Subir archivos PDF", type=["pdf"], accept_multiple_files=True)
 
-# ========================================
-# 🚀 Submit Button 🚀
-# ========================================
-# Submit button
-if st.button("⬆️ Upload"):
+    # ========================================
+    # 🚀 Submit Button 🚀
+    # ========================================
+    # Submit button
+    submitted = st.form_submit_button("⬆️ Upload")
+
+if submitted:
     
     errors = validate_inputs(email, password, files)
     
@@ -89,64 +156,82 @@ if st.button("⬆️ Upload"):
             st.warning(error)
     
     else:
-        name = re.sub(r'[^a-zA-Z0-9]', '', email.split('@')[0])  # Remove non-alphanumeric characters
+        name = _NONALNUM_RE.sub('', email.split('@')[0])  # Remove non-alphanumeric characters
         
         try:
             # ☁️ Read workListFile
-            workListFile = st.session_state.gdrive.read_csv_from_drive(
-                file_name="workListFile.csv", folder_id=FOLDER_ID["DocsToProcess_id"]
-                )
+            workListFile = read_worklist(st.session_state.gdrive)
+            worklist_etag = workListFile.attrs.get("etag")  # Version the update below is based on
             
-            # Determine if cleanup is needed
-            existing_record = workListFile[workListFile["email"] == email]
-            cleanup_required = not existing_record.empty and existing_record["status"].iloc[0] != "Ready"
+            # Determine if the service was already provided or a cleanup is needed
+            email_index = build_email_index(workListFile)
+            user_rows = email_index.get(email)
+            already_served = bool(user_rows) and workListFile.at[user_rows[0], "status"] == "Ready"
+            cleanup_required = bool(user_rows) and not already_served
             
-            if cleanup_required:
-                # 🧹 Clean previous uploads (only if not marked as 'Ready')
-                st.session_state.gdrive.delete_user_folder_if_exists(FOLDER_ID["DocsOrig_id"], name)
-                st.session_state.gdrive.delete_user_folder_if_exists(FOLDER_ID["DocsToProcess_id"], name)
+            if already_served:
+                st.error(f"❌ Ya se brindó el servicio a la cuenta: {email}")
             
-            # Check if user's folder already exists, otherwise create it
-            user_folder_id = st.session_state.gdrive.create_folder_if_not_exists(
-                folder_name=name, parent_folder_id=FOLDER_ID["DocsOrig_id"]
-            )
-            user_folder_txts = st.session_state.gdrive.create_folder_if_not_exists(
-                folder_name=name, parent_folder_id=FOLDER_ID["DocsToProcess_id"]
-            )
+            else:
+                gdrive = st.session_state.gdrive
+                user_parents = [FOLDER_ID["DocsOrig_id"], FOLDER_ID["DocsToProcess_id"]]
                 
-            
-            # Track if at least one successful upload occurs
-            successful_uploads = False
-            
-            for file in files:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-                    temp_file.write(file.getbuffer())
-                    temp_file_path = temp_file.name
+                # 🔍 Look up the user's folders under both parents in one request
+                existing_folders = gdrive.find_folders(name, user_parents)
+                deletes = []
+                if cleanup_required:
+                    # 🧹 Clean previous uploads (only if not marked as 'Ready')
+                    deletes = list(existing_folders.values())
+                    existing_folders = {}
                 
-                final_filename = f"{name}_{file.name}"
-                txt_filename = f"{final_filename}.txt"
+                # Delete stale folders and create the missing ones in a single batch request
+                creates = [(name, parent_id) for parent_id in user_parents if parent_id not in existing_folders]
+                created_folders = gdrive.batch_delete_and_create(deletes, creates)
                 
-                status, workListFile = update_observation(workListFile, txt_filename, email)
-
-                if status == "Negado: Servicio ya provisto.":
-                    st.error(f"❌ Ya se brindó el servicio a la cuenta: {email}")
-                else:
-                    file_id = st.session_state.gdrive.upload_file(
-                        temp_file_path, file_name=final_filename, folder_id=user_folder_id
-                        )
-                    txt_id = st.session_state.gdrive.extract_text_and_upload(
-                        temp_file_path, file_name=final_filename, folder_id=user_folder_txts
-                        )
+                user_folder_id = existing_folders.get(FOLDER_ID["DocsOrig_id"]) or created_folders.get((name, FOLDER_ID["DocsOrig_id"]))
+                user_folder_txts = existing_folders.get(FOLDER_ID["DocsToProcess_id"]) or created_folders.get((name, FOLDER_ID["DocsToProcess_id"]))
+                if not user_folder_id or not user_folder_txts:
+                    # Never upload without a destination folder (the file would land in the account's root)
+                    raise RuntimeError(f"No se pudo preparar la carpeta de '{name}'.")
+                
+                # Upload all files concurrently
+                executor = get_upload_executor()
+                uploads = [
+                    (file.name, submit_uploads(executor, gdrive, file, f"{name}_{file.name}", user_folder_id, user_folder_txts))
+                    for file in files
+                ]
+                uploaded_names = []
+                failed_names = []
+                upload_errors = {}
+                for file_name, (pdf_future, txt_future) in uploads:
+                    # Wait for every upload, even after a failure, so each file gets its own outcome
+                    try:
+                        file_id = pdf_future.result()  # upload_file reports errors by returning None
+                        txt_id = txt_future.result()   # extract_text_and_upload raises them
+                    except Exception as e:
+                        file_id = txt_id = None
+                        upload_errors[file_name] = e
+                    if file_id and txt_id:
+                        uploaded_names.append(file_name)
+                    else:
+                        failed_names.append(file_name)
+                
+                # Streamlit calls are not thread-safe, so report once all uploads are done
+                for file_name in uploaded_names:
                     # Store uploaded files in session state
-                    st.session_state.uploaded_files.append(file.name)
-                    st.success(f"✅ {file.name} cargado correctamente.")
-                    successful_uploads = True
-            
-            if successful_uploads:
-                csv_id = st.session_state.gdrive.update_csv_from_df_retry(
-                    workListFile, file_name="workListFile.csv", folder_id=FOLDER_ID["DocsToProcess_id"]
-                    )
-                st.info("📄 Base de datos actualizado correctamente.")
+                    st.session_state.uploaded_files.append(file_name)
+                    st.success(f"✅ {file_name} cargado correctamente.")
+                for file_name in failed_names:
+                    error = upload_errors.get(file_name)
+                    st.error(f"❌ Error al cargar: {file_name}" + (f" ({error})" if error else ""))
+                
+                if uploaded_names:
+                    # Register the submission with a single worklist update: one record per email, pointing
+                    # to the text of the last file actually uploaded (same result as updating it once per file)
+                    txt_filename = f"{name}_{uploaded_names[-1]}.txt"
+                    status, workListFile = update_observation(workListFile, txt_filename, email, email_index)
+                    csv_id = save_worklist(gdrive, workListFile, worklist_etag, txt_filename, email)
+                    st.info("📄 Base de datos actualizado correctamente.")
 
                 
         except Exception as e:
@@ -1,8 +1,6 @@
 import streamlit as st
-from utils import GoogleDriveFolder, is_valid_email, is_valid_password, update_observation
-from datetime import datetime
-import time, re
-from datetime import datetime
+from utils import GoogleDriveFolder, is_valid_email, is_valid_password, update_observation, get_retry_after, UpdateConflictError
+import time, re, random
 
 # Access secrets
 FOLDER_ID = st.secrets["google"]
@@ -11,18 +9,45 @@ CREDENTIALS = dict(st.secrets["gcp_service_account"])
 
 PASSWORD = str(st.secrets["app"]["password"])
 
+WORKLIST_FILE = "workListFile.csv"
+WORKLIST_MAX_ATTEMPTS = 3
+_NONALNUM_RE = re.compile(r'[^a-zA-Z0-9]')
+
+# Shared across sessions and reruns so the service is authenticated/built only once per process
+@st.cache_resource
+def get_gdrive():
+    return GoogleDriveFolder(credentials=CREDENTIALS, folder_id=FOLDER_ID)
+
 # Retry Authentication
 def authenticate_with_retries(max_retries=3):
+    delay = 0.2
     for attempt in range(1, max_retries + 1):
         try:
-            st.session_state.gdrive = GoogleDriveFolder(credentials=CREDENTIALS, folder_id=FOLDER_ID)
+            st.session_state.gdrive = get_gdrive()
             return True
         except Exception as e:
             st.warning(f"Authentication failed (Attempt {attempt}/{max_retries}): {e}")
-            time.sleep(2)
+            # Honor the server's Retry-After, otherwise back off exponentially with jitter
+            time.sleep(get_retry_after(e) or delay + random.random() * delay)
+            delay *= 2
     st.error("Failed to authenticate with Google Drive after multiple attempts.")
     return False
 
+# Save the worklist only if nobody changed it since it was read (etag); otherwise re-read it and
+# re-apply this submission, so another writer's updates are never overwritten
+def save_worklist(gdrive, workListFile, worklist_etag, txt_filename, email):
+    for attempt in range(WORKLIST_MAX_ATTEMPTS):
+        try:
+            return gdrive.update_csv_from_df_retry(
+                workListFile, file_name=WORKLIST_FILE, folder_id=FOLDER_ID["DocsToProcess_id"], etag=worklist_etag
+                )
+        except UpdateConflictError:
+            if attempt == WORKLIST_MAX_ATTEMPTS - 1:
+                raise
+            workListFile = gdrive.read_csv_from_drive(file_name=WORKLIST_FILE, folder_id=FOLDER_ID["DocsToProcess_id"])
+            worklist_etag = workListFile.attrs.get("etag")
+            _, workListFile = update_observation(workListFile, txt_filename, email)
+
 # Ensure authentication on app start
 if "gdrive" not in st.session_state:
     if not authenticate_with_retries():
@@ -38,16 +63,20 @@ st.write("""Este sistema permite cargar un documento PDF, a partir del cuál se
 
 📢 **Notificación**: Una vez que su documento sea procesado, recibirá una copia en el correo electrónico registrado.""", unsafe_allow_html=True)
 
-# User input fields
-email = st.text_input("Email")
-password = st.text_input("Contraseña", type="password")
-file = st.file_uploader("Elija un archivo PDF", type=["pdf"])
+# User input fields (buffered in a form, so typing does not rerun the script)
+with st.form("upload_form"):
+    email = st.text_input("Email")
+    password = st.text_input("Contraseña", type="password")
+    file = st.file_uploader("Elija un archivo PDF", type=["pdf"])
+
+    # Submit button
+    submitted = st.form_submit_button("⬆️ Upload")
 
-valid_email = is_valid_email(email)
-valid_password = is_valid_password(password, PASSWORD)
+if submitted:
+    # Validate only on submit, not on every rerun
+    valid_email = is_valid_email(email)
+    valid_password = is_valid_password(password, PASSWORD)
 
-# Submit button
-if st.button("⬆️ Upload"):
     if valid_email and valid_password and file:
         # Save uploaded file temporarily
         temp_file_path = f"{file.name}"
@@ -58,12 +87,13 @@ if st.button("⬆️ Upload"):
         #workListFile = st.session_state.gdrive.read_csv_from_gdrive("DocsToProcess/workListFile.csv")
         #print(workListFile)
         name = email.split('@')[0]
-        name = re.sub(r'[^a-zA-Z0-9]', '', name) # Eliminar caracteres no alfanuméricos
+        name = _NONALNUM_RE.sub('', name) # Eliminar caracteres no alfanuméricos
         #date = datetime.today().strftime("%d_%m_%Y")
         # Upload file
         try:
             # ☁️ Read the folder
-            workListFile = st.session_state.gdrive.read_csv_from_drive(file_name="workListFile.csv", folder_id=FOLDER_ID["DocsToProcess_id"])
+            workListFile = st.session_state.gdrive.read_csv_from_drive(file_name=WORKLIST_FILE, folder_id=FOLDER_ID["DocsToProcess_id"])
+            worklist_etag = workListFile.attrs.get("etag")  # Captured here: update_observation may return a concat copy without attrs
             print("🐢")
             print(workListFile)
             status, workListFile = update_observation(workListFile, f"{name}.txt", email)
@@ -76,7 +106,7 @@ if st.button("⬆️ Upload"):
             else:
                 file_id = st.session_state.gdrive.upload_file(temp_file_path, file_name=f'{name}.pdf', folder_id=FOLDER_ID["DocsOrig_id"])
                 txt_id = st.session_state.gdrive.extract_text_and_upload(temp_file_path, file_name=f'{name}.txt', folder_id=FOLDER_ID["DocsToProcess_id"])
-                csv_id = st.session_state.gdrive.update_csv_from_df_retry(workListFile, file_name="workListFile.csv", folder_id=FOLDER_ID["DocsToProcess_id"])
+                csv_id = save_worklist(st.session_state.gdrive, workListFile, worklist_etag, f"{name}.txt", email)
             
             if status == "Aceptado: Sobre-Escritura.":
                 st.success(f"✅ Se identificó archivo previamente subido. Sobre-escritura exitosa! Al culminar el proceso, se mandará el resultado a {email} .ID de Archivo: {file_id}, ID CSV:{csv_id}")
@@ -1,17 +1,49 @@
 import logging
 from pydrive2.auth import GoogleAuth
 from pydrive2.drive import GoogleDrive
+from pydrive2.files import ApiRequestError
 from oauth2client.service_account import ServiceAccountCredentials
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
 import numpy as np
 import pandas as pd
-from scipy.cluster.hierarchy import fcluster, linkage
-import re, io, os, tempfile, time
-import pymupdf
+import re, io, os, threading, mimetypes, hmac, hashlib, json, functools
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# PyMuPDF is not thread-safe; uploads may run concurrently but PDF parsing is serialized.
+# (Drive calls are safe across threads: pydrive2 keeps one authorized http object per thread.)
+_PYMUPDF_LOCK = threading.Lock()
+
+# Uploads below this size go out in one request; larger ones are resumable, sent in large chunks.
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+RESUMABLE_THRESHOLD = 20 * 1024 * 1024
+# Drive requires resumable chunks to be a multiple of 256 KiB.
+CHUNK_GRANULARITY = 256 * 1024
+# Retries (with exponential backoff) of a failed request or chunk before giving up.
+UPLOAD_NUM_RETRIES = 3
+
+# Maximum number of calls Drive accepts in one batch request.
+BATCH_MAX_REQUESTS = 100
+
+# Simultaneous uploads in upload_folder; pydrive2 keeps one http connection per thread.
+UPLOAD_MAX_WORKERS = 8
+
+# Partial response for listings: only the fields the code reads (nextPageToken keeps GetList paginating).
+LIST_FIELDS = 'items(id,title,mimeType,parents(id)),nextPageToken'
+
+class UpdateConflictError(Exception):
+    """
+    Raised when a file changed on Drive since the version an update was based on (HTTP 409/412).
+    The caller should re-read the file, re-apply its change and try again.
+    """
+
+
 class GoogleDriveFolder:
+    _drive_lock = threading.Lock()  # Guards _get_drive, so concurrent first calls authenticate once
+
     def __init__(self, credentials, folder_id=None):
         """
         Initializes the GoogleDriveFolder instance and authenticates.
@@ -22,23 +54,53 @@ class GoogleDriveFolder:
         self.folder_id = folder_id
         self.drive = self.authenticate_google_drive()
 
+        self._folder_cache = {}  # (parent_id, folder_name) -> folder_id, for nested folder paths
+        self._cache_lock = threading.Lock()  # Guards every write to _folder_cache
+
     def authenticate_google_drive(self):
+        """
+        Returns the authenticated GoogleDrive instance for self.credentials.
+        Instances built from the same credentials share one client (see _get_drive).
+        """
+        with GoogleDriveFolder._drive_lock:
+            return GoogleDriveFolder._get_drive(self._credentials_key(self.credentials))
+
+    @staticmethod
+    def _credentials_key(credentials) -> tuple:
+        """
+        Identifies credentials for _get_drive: a key file by path and modification time
+        (so a replaced key is picked up), a dictionary by its JSON serialization.
+        """
+        if isinstance(credentials, str):  # If it's a file path
+            path = os.path.abspath(credentials)
+            return ('path', path, os.path.getmtime(path))
+        if isinstance(credentials, dict):  # If it's a dictionary
+            return ('dict', json.dumps(credentials, sort_keys=True))
+        raise ValueError("Invalid credentials format. Provide a file path (str) or a dictionary (dict).")
+
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def _get_drive(creds_key: tuple) -> GoogleDrive:
         """
         Authenticates using the Service Account and returns the GoogleDrive instance.
-        Supports both JSON file path and dictionary credentials.
+        Cached per credentials key, so the key parsing, JWT signing and service construction
+        happen once per process rather than once per GoogleDriveFolder.
+        :param creds_key: The key from _credentials_key.
         """
         scopes = ["https://www.googleapis.com/auth/drive"]
         gauth = GoogleAuth()
 
         try:
-            if isinstance(self.credentials, str):  # If it's a file path
-                creds = ServiceAccountCredentials.from_json_keyfile_name(self.credentials, scopes)
-            elif isinstance(self.credentials, dict):  # If it's a dictionary
-                creds = ServiceAccountCredentials.from_json_keyfile_dict(self.credentials, scopes)
+            if creds_key[0] == 'path':
+                creds = ServiceAccountCredentials.from_json_keyfile_name(creds_key[1], scopes)
             else:
-                raise ValueError("Invalid credentials format. Provide a file path (str) or a dictionary (dict).")
+                creds = ServiceAccountCredentials.from_json_keyfile_dict(json.loads(creds_key[1]), scopes)
 
             gauth.credentials = creds
+            # Build the Drive service once (static discovery document) instead of on first call.
+            # Responses are already gzip-compressed: googleapiclient and httplib2 send
+            # "accept-encoding: gzip" and a "(gzip)" user agent on every request, downloads included.
+            gauth.Authorize()
             drive = GoogleDrive(gauth)
             logging.info("Authenticated successfully with Google Drive!")
             return drive
@@ -47,6 +109,136 @@ class GoogleDriveFolder:
             logging.error(f"Authentication failed: {e}")
             raise
 
+    def _service(self):
+        """
+        Returns the underlying googleapiclient Drive (v2) service used by pydrive2.
+        """
+        if self.drive.auth.service is None:
+            self.drive.auth.Authorize()
+        return self.drive.auth.service
+
+    def _http(self):
+        """
+        Returns the authorized http object of the current thread (the same one pydrive2 uses),
+        so direct service calls stay thread-safe.
+        """
+        thread_local = self.drive.auth.thread_local
+        if not getattr(thread_local, "http", None):
+            thread_local.http = self.drive.auth.Get_Http_Object()
+        return thread_local.http
+
+    def _batch_delete(self, file_ids: list[str]):
+        """
+        Deletes files in batch HTTP requests (one round-trip per 100 files) instead of one request per file.
+        :param file_ids: IDs of the files to delete.
+        :raises: The first error reported for any of the deletes (a file that is already gone counts as deleted).
+        """
+        errors = []
+
+        def callback(request_id, response, exception):
+            if exception is not None and not is_not_found(exception):
+                errors.append(exception)
+
+        service = self._service()
+        for start in range(0, len(file_ids), BATCH_MAX_REQUESTS):
+            batch = service.new_batch_http_request(callback=callback)
+            for file_id in file_ids[start:start + BATCH_MAX_REQUESTS]:
+                batch.add(service.files().delete(fileId=file_id, supportsAllDrives=True))
+            batch.execute(http=self._http())
+
+        if errors:
+            raise errors[0]
+
+    def _list(self, query: str, fields: str = None) -> list:
+        """
+        Runs a files.list query. Listings are never cached: they decide what gets deleted or skipped,
+        and other writers (the worklist backend, other processes) change folders at any time.
+
+        :param query: The Drive search query.
+        :param fields: Partial-response fields (default LIST_FIELDS).
+        :return: A list of GoogleDriveFile.
+        """
+        return self.drive.ListFile({'q': query, 'fields': fields or LIST_FIELDS}).GetList()
+
+    def _forget_folders(self, folder_ids: list[str]):
+        """
+        Removes deleted folders from the nested-folder cache.
+        """
+        with self._cache_lock:
+            for key in [k for k, v in self._folder_cache.items() if v in folder_ids]:
+                del self._folder_cache[key]
+
+    def _build_media(self, source, mimetype, chunk_size_mb: float = None):
+        """
+        Builds the media body for an upload: a single non-resumable request for files under
+        RESUMABLE_THRESHOLD, otherwise a resumable upload in UPLOAD_CHUNK_SIZE chunks.
+        :param source: A local file path or a binary file-like object.
+        :param mimetype: The MIME type of the content.
+        :param chunk_size_mb: If given, always upload resumably in chunks of this size
+                              (rounded down to a multiple of 256 KiB).
+        :return: A MediaUpload instance.
+        """
+        if isinstance(source, str):
+            size = os.path.getsize(source)
+        else:
+            size = source.seek(0, io.SEEK_END)
+            source.seek(0)
+
+        if chunk_size_mb:
+            resumable = True
+            chunksize = max(1, int(chunk_size_mb * 1024 * 1024) // CHUNK_GRANULARITY) * CHUNK_GRANULARITY
+        else:
+            resumable = size >= RESUMABLE_THRESHOLD
+            chunksize = UPLOAD_CHUNK_SIZE if resumable else -1
+
+        if isinstance(source, str):
+            return MediaFileUpload(source, mimetype=mimetype, chunksize=chunksize, resumable=resumable)
+        return MediaIoBaseUpload(source, mimetype=mimetype, chunksize=chunksize, resumable=resumable)
+
+    def _execute_upload(self, request, file_name: str) -> dict:
+        """
+        Executes a files().insert/update request carrying a media body.
+        Resumable uploads are sent chunk by chunk, logging progress; a chunk that fails
+        with a transient error is retried from the last byte Drive acknowledged.
+        :param request: The HttpRequest to execute.
+        :param file_name: The file name, for logging.
+        :return: The response resource.
+        """
+        http = self._http()
+        if not request.resumable:
+            return request.execute(http=http, num_retries=UPLOAD_NUM_RETRIES)
+
+        response = None
+        while response is None:
+            status, response = request.next_chunk(http=http, num_retries=UPLOAD_NUM_RETRIES)
+            if status:
+                logging.info(f"Uploading '{file_name}': {int(status.progress() * 100)}%")
+        return response
+
+    def _insert_file(self, file_name: str, folder_id: str, media, fields: str = 'id') -> dict:
+        """
+        Creates a file in a folder from a media body (see _build_media).
+        """
+        file_metadata = {'title': file_name}
+        if folder_id:
+            file_metadata['parents'] = [{'id': folder_id}]
+        request = self._service().files().insert(
+            body=file_metadata, media_body=media, supportsAllDrives=True, fields=fields
+        )
+        return self._execute_upload(request, file_name)
+
+    def _update_file(self, file_id: str, file_name: str, media, fields: str = 'id', etag: str = None) -> dict:
+        """
+        Replaces the content of an existing file, keeping its ID and metadata.
+        If an etag is given, the update only applies to that version of the file (HTTP 412 otherwise).
+        """
+        request = self._service().files().update(
+            fileId=file_id, media_body=media, supportsAllDrives=True, fields=fields
+        )
+        if etag:
+            request.headers['If-Match'] = etag
+        return self._execute_upload(request, file_name)
+
     def get_folder_files(self):
         """
         Lists the files in the specified folder or root.
@@ -54,7 +246,7 @@ class GoogleDriveFolder:
         """
         try:
             query = f"'{self.folder_id}' in parents and trashed=false" if self.folder_id else "trashed=false"
-            file_list = self.drive.ListFile({'q': query}).GetList()
+            file_list = self.drive.ListFile({'q': query, 'fields': LIST_FIELDS}).GetList()
 
             logging.info(f"Found {len(file_list)} files in folder '{self.folder_id or 'root'}'.")
             return file_list
@@ -94,7 +286,12 @@ class GoogleDriveFolder:
         try:
             # 🔍 Search for the folder
             query = f"title = '{folder_name}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false and '{parent_folder_id}' in parents"
-            file_list = self.drive.ListFile({'q': query}).GetList()
+            file_list = self.drive.ListFile({
+                'q': query,
+                'fields': 'items(id)',
+                'maxResults': 10,
+                'spaces': 'drive'
+            }).GetList()
 
             if file_list:
                 folder_id = file_list[0]['id']
@@ -113,35 +310,43 @@ class GoogleDriveFolder:
             logging.error(f"Error checking/creating folder '{folder_name}': {e}")
             return None
 
-    def upload_file(self, file_path:str, file_name:str, folder_id:str):
+    def upload_file(self, source, file_name:str, folder_id:str, chunk_size_mb:float=None):
         """
         Uploads a file to Google Drive, enforcing overwrite if the file already exists.
+        Small files are sent in a single request, large ones as a resumable upload.
+        The upload is skipped if an identical file (same MD5) is already stored.
 
-        :param file_path: The local file path.
+        :param source: The local file path or a binary file-like object (e.g., io.BytesIO).
         :param file_name: The destination file name in Drive (e.g., "file.pdf").
         :param folder_id: The ID of the destination folder in Google Drive (default is "root").
+        :param chunk_size_mb: Force a resumable upload in chunks of this many MB.
         :return: The uploaded file's ID.
         """
         try:
+            mimetype = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+
             # Check if file exists locally
-            if not os.path.exists(file_path):
-                logging.error(f"Error: File '{file_path}' does not exist.")
+            if isinstance(source, str) and not os.path.exists(source):
+                logging.error(f"Error: File '{source}' does not exist.")
                 return None
+            media = self._build_media(source, mimetype, chunk_size_mb)
 
             # Check if the file already exists in the folder
-            query = f"title = '{file_name}' and mimeType != 'application/vnd.google-apps.folder' and '{folder_id}' in parents"
-            existing_files = self.drive.ListFile({'q': query}).GetList()
+            query = f"title = '{file_name}' and mimeType != 'application/vnd.google-apps.folder' and '{folder_id}' in parents and trashed = false"
+            existing_files = self._list(query, fields='items(id,title,md5Checksum)')
+
+            # Same content already stored: nothing to upload
+            if len(existing_files) == 1 and existing_files[0].get('md5Checksum') == md5_hexdigest(source):
+                logging.info(f"File '{file_name}' is unchanged in folder ID '{folder_id}', skipping upload.")
+                return existing_files[0]['id']
 
-            # Delete existing files with the same name (overwrite enforcement)
+            # Delete existing files with the same name (overwrite enforcement), in a single batch request
             for f in existing_files:
                 logging.info(f"Deleting existing file: {f['title']}")
-                f.Delete()
+            self._batch_delete([f['id'] for f in existing_files])
 
             # Upload the new file
-            file_metadata = {'title': file_name, 'parents': [{'id': folder_id}]}
-            file = self.drive.CreateFile(file_metadata)
-            file.SetContentFile(file_path)
-            file.Upload()
+            file = self._insert_file(file_name, folder_id, media)
 
             logging.info(f"File '{file_name}' uploaded successfully to folder ID '{folder_id}', replacing any previous versions.")
             return file['id']
@@ -166,12 +371,7 @@ class GoogleDriveFolder:
                 return None
 
             if file_content is not None:
-                # Convert string content to a file-like object
-                if isinstance(file_content, str):
-                    file_obj = io.StringIO(file_content)  # Text-based file
-                elif isinstance(file_content, bytes):
-                    file_obj = io.BytesIO(file_content)  # Binary file
-                else:
+                if not isinstance(file_content, (str, bytes)):
                     logging.error("Error: file_content must be a string or bytes.")
                     return None
             else:
@@ -181,23 +381,23 @@ class GoogleDriveFolder:
 
             # Check if the file already exists in the folder
             query = f"title = '{file_name}' and mimeType != 'application/vnd.google-apps.folder' and '{folder_id}' in parents"
-            existing_files = self.drive.ListFile({'q': query}).GetList()
+            existing_files = self._list(query)
 
-            # Delete existing files with the same name (overwrite enforcement)
+            # Delete existing files with the same name (overwrite enforcement), in a single batch request
             for f in existing_files:
                 logging.info(f"Deleting existing file: {f['title']}")
-                f.Delete()
+            self._batch_delete([f['id'] for f in existing_files])
 
             # Upload the file
-            file_metadata = {'title': file_name, 'parents': [{'id': folder_id}]}
-            file = self.drive.CreateFile(file_metadata)
-
-            if file_content is not None:
-                file.SetContentString(file_obj.getvalue())  # Set content directly from variable
+            if isinstance(file_content, str):
+                file = self.drive.CreateFile({'title': file_name, 'parents': [{'id': folder_id}]})
+                file.SetContentString(file_content)  # Set content directly from variable
+                file.Upload()
             else:
-                file.SetContentFile(file_path)  # Upload from file
-
-            file.Upload()
+                # Binary content is sent as-is (BytesIO shares the bytes, no copy); text decoding would corrupt it
+                mimetype = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+                source = io.BytesIO(file_content) if file_content is not None else file_path
+                file = self._insert_file(file_name, folder_id, self._build_media(source, mimetype))
 
             logging.info(f"File '{file_name}' uploaded successfully to folder ID '{folder_id}', replacing any previous versions.")
             return file['id']
@@ -206,21 +406,26 @@ class GoogleDriveFolder:
             logging.error(f"Error uploading file '{file_name}': {e}")
             return None
 
-    def upload_folder(self, folder_path: str, destination_folder_id: str) -> list[str]:
+    def upload_folder(self, folder_path: str, destination_folder_id: str, max_workers: int = UPLOAD_MAX_WORKERS) -> list[str]:
         """
         Uploads all files from a local folder to a Google Drive folder.
+        Files are uploaded concurrently; each worker thread uses its own authorized connection.
         :param folder_path: Local path to the folder.
         :param destination_folder_id: Google Drive folder ID.
+        :param max_workers: Maximum number of simultaneous uploads.
         :return: List of uploaded file IDs.
         """
-        uploaded_ids = []
-        for file_name in os.listdir(folder_path):
-            full_path = os.path.join(folder_path, file_name)
-            if os.path.isfile(full_path):
-                file_id = self.upload_file(full_path, file_name, destination_folder_id)
-                if file_id:
-                    uploaded_ids.append(file_id)
-        return uploaded_ids
+        file_names = [name for name in sorted(os.listdir(folder_path))
+                      if os.path.isfile(os.path.join(folder_path, name))]
+        if not file_names:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(file_names))) as executor:
+            results = executor.map(
+                lambda name: self.upload_file(os.path.join(folder_path, name), name, destination_folder_id),
+                file_names,
+            )
+            return [file_id for file_id in results if file_id]
     
     def update_observations_bulk(df: pd.DataFrame, file_email_pairs: list[tuple[str, str]]) -> tuple[str, pd.DataFrame]:
         """
@@ -239,10 +444,10 @@ class GoogleDriveFolder:
     
     def delete_existing_files(self, file_name: str, folder_id: str):
         query = f"title = '{file_name}' and mimeType != 'application/vnd.google-apps.folder' and '{folder_id}' in parents"
-        existing_files = self.drive.ListFile({'q': query}).GetList()
+        existing_files = self._list(query)
         for f in existing_files:
             logging.info(f"Deleting existing file: {f['title']}")
-            f.Delete()
+        self._batch_delete([f['id'] for f in existing_files])
 
     def get_or_create_folder(self, user_name):
         """
@@ -252,7 +457,7 @@ class GoogleDriveFolder:
         """
         try:
             query = f"'{self.folder_id}' in parents and title = '{user_name}' and mimeType = 'application/vnd.google-apps.folder' and trashed=false"
-            folder_list = self.drive.ListFile({'q': query}).GetList()
+            folder_list = self.drive.ListFile({'q': query, 'fields': 'items(id)', 'maxResults': 1}).GetList()
 
             if folder_list:
                 return folder_list[0]['id']
@@ -267,74 +472,112 @@ class GoogleDriveFolder:
     def create_nested_folders(self, folder_path):
         """
         Recursively creates nested folders in Google Drive.
+        The existing part of the path is resolved with a single query (see _resolve_folder_path);
+        only the missing folders are created.
 
         :param folder_path: The full folder path (e.g., "DocsToProcess/DocsOrig").
         :return: The final folder ID where the file should be uploaded.
         """
-        parent_id = None  # Start at root
         folders = folder_path.split("/")
+        parent_id, resolved = self._resolve_folder_path(folders, None)  # Start at root
+        if resolved:
+            logging.info(f"Found existing folder: '{'/'.join(folders[:resolved])}' with ID: {parent_id}")
 
-        for folder in folders:
-            # Check if folder exists under the parent
-            query = f"title = '{folder}' and mimeType = 'application/vnd.google-apps.folder' and trashed=false"
-            if parent_id:
-                query += f" and '{parent_id}' in parents"
-
-            existing_folders = self.drive.ListFile({'q': query}).GetList()
-
-            if existing_folders:
-                folder_id = existing_folders[0]['id']  # Use existing folder
-                logging.info(f"Found existing folder: '{folder}' with ID: {folder_id}")
-            else:
-                # Create new folder
-                folder_metadata = {
-                    'title': folder,
-                    'mimeType': 'application/vnd.google-apps.folder',
-                    'parents': [{'id': parent_id}] if parent_id else []
-                }
-                folder_obj = self.drive.CreateFile(folder_metadata)
-                folder_obj.Upload()
-                folder_id = folder_obj['id']
-                logging.info(f"Created new folder: '{folder}' with ID: {folder_id}")
+        for folder in folders[resolved:]:
+            # Create new folder
+            folder_metadata = {
+                'title': folder,
+                'mimeType': 'application/vnd.google-apps.folder',
+                'parents': [{'id': parent_id}] if parent_id else []
+            }
+            folder_obj = self.drive.CreateFile(folder_metadata)
+            folder_obj.Upload()
+            folder_id = folder_obj['id']
+            logging.info(f"Created new folder: '{folder}' with ID: {folder_id}")
 
+            with self._cache_lock:
+                self._folder_cache[(parent_id, folder)] = folder_id
             parent_id = folder_id  # Move to next level
 
         return parent_id
-    
-    def read_csv_from_drive(self, file_name, folder_id):
+
+    def _resolve_folder_path(self, folders: list[str], parent_id: str = None) -> tuple[str, int]:
+        """
+        Follows a folder path as far as it already exists, using the nested-folder cache and then
+        one files.list query for all remaining path segments, matched to their parents locally.
+
+        :param folders: The path segments (e.g., ["DocsToProcess", "Reports"]).
+        :param parent_id: Where the path starts: a folder ID, "root" for My Drive, or None for anywhere.
+        :return: The ID of the deepest existing folder (parent_id if none) and the number of segments resolved.
+        """
+        resolved = 0
+        while resolved < len(folders) and (parent_id, folders[resolved]) in self._folder_cache:
+            parent_id = self._folder_cache[(parent_id, folders[resolved])]
+            resolved += 1
+        if resolved == len(folders):
+            return parent_id, resolved
+
+        titles = " or ".join(f"title = '{folder}'" for folder in dict.fromkeys(folders[resolved:]))
+        query = f"mimeType = 'application/vnd.google-apps.folder' and trashed = false and ({titles})"
+        candidates = self.drive.ListFile({
+            'q': query,
+            'fields': 'items(id,title,parents(id,isRoot)),nextPageToken'
+        }).GetList()
+
+        # (parent_id, title) -> folder ID, keeping the first match like the per-level queries did
+        children = {}
+        for candidate in candidates:
+            children.setdefault((None, candidate['title']), candidate['id'])
+            for parent in candidate.get('parents', []):
+                children.setdefault((parent['id'], candidate['title']), candidate['id'])
+                if parent.get('isRoot'):
+                    children.setdefault(("root", candidate['title']), candidate['id'])
+
+        for folder in folders[resolved:]:
+            folder_id = children.get((parent_id, folder))
+            if folder_id is None:
+                break
+            with self._cache_lock:
+                self._folder_cache[(parent_id, folder)] = folder_id
+            parent_id = folder_id
+            resolved += 1
+
+        return parent_id, resolved
+
+    def read_csv_from_drive(self, file_name, folder_id, dtype=None):
         """
         Reads a CSV file from a specific Google Drive folder (including Shared Drives) and loads it into a pandas DataFrame.
+        The raw bytes are handed to pandas' C parser, without decoding them to a string first.
         :param file_name: The name of the CSV file to read.
         :param folder_id: The ID of the folder containing the file.
-        :return: A pandas DataFrame containing the file data, or None if an error occurs.
+        :param dtype: Optional column types passed to pandas.read_csv (skips type inference for those columns).
+        :return: A pandas DataFrame containing the file data, with the etag of the version read in
+                 df.attrs['etag'] (see update_csv_from_df_retry), or None if an error occurs.
         """
         try:
-            # First, list all files in the folder
-            file_list = self.list_files_in_shared_drive(folder_id)
-            
-            if not file_list:
-                logging.error(f"No files found in folder {folder_id}.")
-                return None
-
-            logging.info(f"Listing files with details: {file_list}")
+            # Look up only the CSV file itself, requesting just the fields used below
+            query = (
+                f"title = '{file_name}' and '{folder_id}' in parents and trashed = false "
+                f"and (mimeType = 'text/csv' or mimeType = 'application/vnd.ms-excel')"
+            )
+            file_list = self.drive.ListFile({
+                'q': query,
+                'fields': 'items(id,title,etag)',
+                'maxResults': 10
+            }).GetList()
 
-            # Filter the files to find the one that matches the name and mimeType (CSV)
-            csv_file = None
-            for file in file_list:
-                logging.info(f"Inspecting file: {file['title']} (MimeType: {file['mimeType']})")
-                if file['title'] == file_name and file['mimeType'] in ['text/csv', 'application/vnd.ms-excel']:
-                    csv_file = file
-                    break
-            
-            if not csv_file:
+            if not file_list:
                 logging.error(f"Error: File '{file_name}' not found in folder ID '{folder_id}'.")
                 return None
 
+            csv_file = file_list[0]
             logging.info(f"Found file: {csv_file['title']} (ID: {csv_file['id']})")
 
-            # Read the file content and load into pandas
-            csv_content = csv_file.GetContentString()
-            df = pd.read_csv(io.StringIO(csv_content))
+            # Download the content as bytes in one (gzip-compressed) request and load into pandas
+            request = self._service().files().get_media(fileId=csv_file['id'], supportsAllDrives=True)
+            csv_content = request.execute(http=self._http())
+            df = pd.read_csv(io.BytesIO(csv_content), engine='c', dtype=dtype)
+            df.attrs['etag'] = csv_file['etag']
 
             logging.info(f"File '{file_name}' successfully read into a DataFrame.")
             return df
@@ -343,11 +586,33 @@ class GoogleDriveFolder:
             logging.error(f"Error reading CSV file '{file_name}': {e}")
             return None
     
+    def get_file_modified_date(self, file_name, folder_id):
+        """
+        Fetches only the last modification timestamp of a file (cheap metadata request).
+        :param file_name: The name of the file.
+        :param folder_id: The ID of the folder containing the file.
+        :return: The file's 'modifiedDate' (RFC 3339 string), or None if not found or on error.
+        """
+        try:
+            query = f"title = '{file_name}' and '{folder_id}' in parents and trashed = false"
+            file_list = self.drive.ListFile({
+                'q': query,
+                'fields': 'items(id,modifiedDate)',
+                'maxResults': 1
+            }).GetList()
+
+            return file_list[0]['modifiedDate'] if file_list else None
+
+        except Exception as e:
+            logging.error(f"Error fetching metadata for '{file_name}': {e}")
+            return None
+    
     def list_files_in_shared_drive(self, folder_id):
         try:
             query = f"'{folder_id}' in parents"
             file_list = self.drive.ListFile({
                 'q': query,
+                'fields': LIST_FIELDS,
                 'supportsAllDrives': True,
                 'includeItemsFromAllDrives': True
             }).GetList()
@@ -359,7 +624,7 @@ class GoogleDriveFolder:
             logging.error(f"Error listing files in folder '{folder_id}': {e}")
             return None
     
-    def upload_csv_from_df(self, df: pd.DataFrame, file_name: str, folder_id: str):
+    def upload_csv_from_df(self, df: pd.DataFrame, file_name: str, folder_id: str, chunk_size_mb: float = None):
         """
         Uploads a CSV file generated from a pandas DataFrame to Google Drive,
         enforcing overwrite if a file with the same name already exists.
@@ -367,43 +632,35 @@ class GoogleDriveFolder:
         :param df: The pandas DataFrame to be saved as CSV.
         :param file_name: The destination file name in Drive (e.g., "data.csv").
         :param folder_id: The ID of the destination folder in Google Drive.
+        :param chunk_size_mb: Force a resumable upload in chunks of this many MB.
         :return: The uploaded file's ID.
         """
         try:
-            # Create a temporary CSV file to store the DataFrame
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp_file:
-                temp_file_path = tmp_file.name
-
-            # Write the DataFrame to the temporary CSV file
-            df.to_csv(temp_file_path, index=False)
+            # Serialize the DataFrame to CSV in memory
+            csv_buffer = io.BytesIO()
+            df.to_csv(csv_buffer, index=False)
 
             # Check if the file already exists in the destination folder
             query = f"title = '{file_name}' and mimeType != 'application/vnd.google-apps.folder' and '{folder_id}' in parents"
-            existing_files = self.drive.ListFile({'q': query}).GetList()
+            existing_files = self._list(query)
 
-            # Delete any existing files with the same name (overwrite enforcement)
+            # Delete any existing files with the same name (overwrite enforcement), in a single batch request
             for f in existing_files:
                 logging.info(f"Deleting existing file: {f['title']}")
-                f.Delete()
+            self._batch_delete([f['id'] for f in existing_files])
 
-            # Prepare file metadata and upload the new CSV file
-            file_metadata = {'title': file_name, 'parents': [{'id': folder_id}]}
-            file = self.drive.CreateFile(file_metadata)
-            file.SetContentFile(temp_file_path)
-            file.Upload()
+            # Upload the new CSV file
+            media = self._build_media(csv_buffer, 'text/csv', chunk_size_mb)
+            file = self._insert_file(file_name, folder_id, media)
 
             logging.info(f"CSV file '{file_name}' uploaded successfully to folder ID '{folder_id}', replacing any previous versions.")
-
-            # Clean up the temporary file
-            #os.remove(temp_file_path)
-
             return file['id']
 
         except Exception as e:
             logging.error(f"Error uploading CSV file '{file_name}': {e}")
             raise
     
-    def update_csv_from_df(self, df: pd.DataFrame, file_name: str, folder_id: str):
+    def update_csv_from_df(self, df: pd.DataFrame, file_name: str, folder_id: str, chunk_size_mb: float = None):
         """
         Uploads a CSV file generated from a pandas DataFrame to Google Drive,
         updating the file if it already exists (preserving metadata) or creating a new one.
@@ -411,121 +668,106 @@ class GoogleDriveFolder:
         :param df: The pandas DataFrame to be saved as CSV.
         :param file_name: The destination file name in Drive (e.g., "data.csv").
         :param folder_id: The ID of the destination folder in Google Drive.
+        :param chunk_size_mb: Force a resumable upload in chunks of this many MB.
         :return: The uploaded file's ID.
         """
         try:
-            # Create a temporary CSV file using mkstemp to avoid Windows file-locking issues.
-            fd, temp_file_path = tempfile.mkstemp(suffix='.csv')
-            os.close(fd)  # Close the file descriptor immediately.
-            
-            # Write the DataFrame to the temporary CSV file.
-            df.to_csv(temp_file_path, index=False)
+            # Serialize the DataFrame to CSV in memory.
+            csv_buffer = io.BytesIO()
+            df.to_csv(csv_buffer, index=False)
             
             # Build the query to check if the file already exists in the destination folder.
             query = (
                 f"title = '{file_name}' and mimeType != 'application/vnd.google-apps.folder' "
                 f"and '{folder_id}' in parents"
             )
-            existing_files = self.drive.ListFile({'q': query}).GetList()
+            existing_files = self._list(query)
+            media = self._build_media(csv_buffer, 'text/csv', chunk_size_mb)
             
             if existing_files:
                 # If the file exists, update its content.
                 file = existing_files[0]
                 logging.info(f"Updating existing file: {file['title']}")
-                file.SetContentFile(temp_file_path)
-                file.Upload()
+                self._update_file(file['id'], file_name, media)
                 
-                # Optionally, if multiple files exist with the same name, remove extras.
-                if len(existing_files) > 1:
-                    for duplicate in existing_files[1:]:
-                        logging.info(f"Deleting duplicate file: {duplicate['title']}")
-                        duplicate.Delete()
+                # If multiple files exist with the same name, remove the extras in a single batch request
+                # (after the content update: media uploads cannot go inside a batch).
+                for duplicate in existing_files[1:]:
+                    logging.info(f"Deleting duplicate file: {duplicate['title']}")
+                self._batch_delete([duplicate['id'] for duplicate in existing_files[1:]])
             else:
                 # If the file does not exist, create a new file.
-                file_metadata = {'title': file_name, 'parents': [{'id': folder_id}]}
-                file = self.drive.CreateFile(file_metadata)
-                file.SetContentFile(temp_file_path)
-                file.Upload()
+                file = self._insert_file(file_name, folder_id, media)
             
             logging.info(
                 f"CSV file '{file_name}' uploaded successfully to folder ID '{folder_id}'."
             )
-            
-            # Clean up the temporary file.
-            #os.remove(temp_file_path)
-            
             return file['id']
 
         except Exception as e:
             logging.error(f"Error uploading CSV file '{file_name}': {e}")
             raise
         
-    def update_csv_from_df_retry(self, df: pd.DataFrame, file_name: str, folder_id: str):
+    def update_csv_from_df_retry(self, df: pd.DataFrame, file_name: str, folder_id: str, chunk_size_mb: float = None, etag: str = None):
         """
         Uploads a CSV file generated from a pandas DataFrame to Google Drive,
         updating the file if it already exists (preserving metadata) or creating a new one.
-        Implements a retry mechanism to handle potential update conflicts.
+        The update is conditional (If-Match) on the etag of the version the DataFrame was read from,
+        so another writer's changes are never overwritten: on a conflict UpdateConflictError is raised
+        and the caller retries by re-reading the file and re-applying its change.
 
         :param df: The pandas DataFrame to be saved as CSV.
         :param file_name: The destination file name in Drive (e.g., "data.csv").
         :param folder_id: The ID of the destination folder in Google Drive.
+        :param chunk_size_mb: Force a resumable upload in chunks of this many MB.
+        :param etag: The etag of the version df is based on (default: df.attrs['etag'] set by
+                     read_csv_from_drive, else the current version, i.e. last writer wins).
         :return: The uploaded file's ID.
+        :raises UpdateConflictError: If the file changed since that version.
         """
         try:
-            # Create a temporary CSV file using mkstemp to avoid Windows file-locking issues.
-            fd, temp_file_path = tempfile.mkstemp(suffix='.csv')
-            os.close(fd)  # Close the file descriptor immediately.
-
-            # Write the DataFrame to the temporary CSV file.
-            df.to_csv(temp_file_path, index=False)
+            # Serialize the DataFrame to CSV in memory.
+            csv_buffer = io.BytesIO()
+            df.to_csv(csv_buffer, index=False)
 
             # Build the query to check if the file already exists in the destination folder.
             query = (
                 f"title = '{file_name}' and mimeType != 'application/vnd.google-apps.folder' "
                 f"and '{folder_id}' in parents"
             )
-            existing_files = self.drive.ListFile({'q': query}).GetList()
+            existing_files = self._list(query, fields='items(id,title,md5Checksum,etag)')
 
-            max_retries = 3
             if existing_files:
                 # If the file exists, update its content.
                 file = existing_files[0]
+
+                # Drive has no partial/append writes, so at least skip re-sending identical content.
+                if file.get('md5Checksum') == md5_hexdigest(csv_buffer) and len(existing_files) == 1:
+                    logging.info(f"CSV file '{file_name}' is unchanged, skipping upload.")
+                    return file['id']
+
                 logging.info(f"Updating existing file: {file['title']}")
 
-                retry_count = 0
-                while retry_count < max_retries:
-                    try:
-                        file.SetContentFile(temp_file_path)
-                        file.Upload()
-                        break  # Upload succeeded, exit the retry loop.
-                    except Exception as e:
-                        # Check for conflict or transient error.
-                        if "conflict" in str(e).lower():
-                            retry_count += 1
-                            wait_time = 2 ** retry_count
-                            logging.warning(f"Conflict detected. Retrying in {wait_time} seconds... (attempt {retry_count})")
-                            time.sleep(wait_time)
-                            file.FetchMetadata()  # Refresh metadata before retrying.
-                            continue
-                        else:
-                            raise
-                else:
-                    raise Exception("Max retries reached. File update failed due to concurrent modifications.")
-
-                # Optionally, if multiple files exist with the same name, remove extras.
-                if len(existing_files) > 1:
-                    for duplicate in existing_files[1:]:
-                        logging.info(f"Deleting duplicate file: {duplicate['title']}")
-                        duplicate.Delete()
+                try:
+                    media = self._build_media(csv_buffer, 'text/csv', chunk_size_mb)
+                    self._update_file(file['id'], file_name, media, etag=etag or df.attrs.get('etag') or file.get('etag'))
+                except HttpError as e:
+                    # A failed precondition (412) or conflict (409): someone else wrote the file first
+                    if e.resp.status in (409, 412):
+                        raise UpdateConflictError(f"'{file_name}' was modified by another writer.") from e
+                    raise
+
+                # If multiple files exist with the same name, remove the extras in a single batch request
+                # (after the content update: media uploads cannot go inside a batch).
+                for duplicate in existing_files[1:]:
+                    logging.info(f"Deleting duplicate file: {duplicate['title']}")
+                self._batch_delete([duplicate['id'] for duplicate in existing_files[1:]])
             else:
                 # If the file does not exist, create a new file.
-                file_metadata = {'title': file_name, 'parents': [{'id': folder_id}]}
-                file = self.drive.CreateFile(file_metadata)
-                file.SetContentFile(temp_file_path)
-                file.Upload()
+                media = self._build_media(csv_buffer, 'text/csv', chunk_size_mb)
+                file = self._insert_file(file_name, folder_id, media)
 
             logging.info(f"CSV file '{file_name}' uploaded successfully to folder ID '{folder_id}'.")
-            #os.remove(temp_file_path)
             return file['id']
 
         except Exception as e:
@@ -539,26 +781,26 @@ class GoogleDriveFolder:
         :param folder_path: The folder path (e.g., "DocsToProcess/Reports").
         :return: The Google Drive folder ID.
         """
-        parent_id = "root"  # Start from root folder
-        for folder in folder_path.split('/'):
-            query = f"title = '{folder}' and mimeType = 'application/vnd.google-apps.folder' and '{parent_id}' in parents"
-            folder_list = self.drive.ListFile({'q': query}).GetList()
+        folders = folder_path.split('/')
+        parent_id, resolved = self._resolve_folder_path(folders, "root")  # Start from root folder
 
-            if folder_list:
-                parent_id = folder_list[0]['id']  # Folder exists, get its ID
-            else:
-                # Folder does not exist, create it
-                folder_metadata = {
-                    'title': folder,
-                    'mimeType': 'application/vnd.google-apps.folder',
-                    'parents': [{'id': parent_id}]
-                }
-                folder = self.drive.CreateFile(folder_metadata)
-                folder.Upload()
-                parent_id = folder['id']  # Get the newly created folder ID
+        for folder in folders[resolved:]:
+            # Folder does not exist, create it
+            folder_metadata = {
+                'title': folder,
+                'mimeType': 'application/vnd.google-apps.folder',
+                'parents': [{'id': parent_id}]
+            }
+            folder_obj = self.drive.CreateFile(folder_metadata)
+            folder_obj.Upload()
+            folder_id = folder_obj['id']  # Get the newly created folder ID
+
+            with self._cache_lock:
+                self._folder_cache[(parent_id, folder)] = folder_id
+            parent_id = folder_id
 
         return parent_id
-    
+
     def upload_text_file(self, text_content, file_name, folder_id=None):
         """
         Uploads text content as a file to Google Drive, enforcing overwrite if a file with the same name exists.
@@ -575,12 +817,12 @@ class GoogleDriveFolder:
             query = f"title = '{file_name}' and mimeType != 'application/vnd.google-apps.folder'"
             if folder_id:
                 query += f" and '{folder_id}' in parents"
-            existing_files = self.drive.ListFile({'q': query}).GetList()
+            existing_files = self._list(query)
 
-            # Delete existing files with the same name
+            # Delete existing files with the same name, in a single batch request
             for f in existing_files:
                 logging.info(f"Deleting existing file: {f['title']}")
-                f.Delete()
+            self._batch_delete([f['id'] for f in existing_files])
 
             # Prepare file metadata including folder info if available
             file_metadata = {'title': file_name}
@@ -599,91 +841,43 @@ class GoogleDriveFolder:
             logging.error(f"Error uploading file '{file_name}': {e}")
             return None
 
-    def extract_text_and_upload(self, pdf_path, file_name, folder_id=None, y_tolerance=5):
+    def extract_text_and_upload(self, pdf, file_name, folder_id=None, y_tolerance=5, chunk_size_mb=None):
         """
-        Extracts text from a PDF file and uploads it to Google Drive without saving locally.
+        Extracts text from a PDF (see extract_text) and uploads it to Google Drive without saving locally.
         Enforces overwrite if a file with the same name exists.
 
-        :param pdf_path: Path to the input PDF file.
+        :param pdf: Path to the input PDF file, its raw bytes or a binary file-like object.
         :param file_name: Name of the output file in Google Drive (e.g., "output.txt").
         :param folder_id: The destination folder ID (if None, uses default).
         :param y_tolerance: Y-axis tolerance for grouping text lines.
+        :param chunk_size_mb: Force a resumable upload in chunks of this many MB.
         :return: The uploaded file's ID (or None if failed).
         """
         folder_id = folder_id or self.default_folder_id
 
         try:
-            doc = pymupdf.open(pdf_path)
-            extracted_text = []
-
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                text_blocks = page.get_text("blocks")
-
-                if not text_blocks:
-                    continue  # Skip empty pages
-
-                # Convert to structured array: (x0, y0, x1, y1, text)
-                block_data = [(b[0], b[1], b[2], b[3], b[4]) for b in text_blocks]
-                block_data = sorted(block_data, key=lambda b: b[1])  # Sort by Y initially
-
-                # Extract x-coordinates for clustering
-                x_positions = np.array([b[0] for b in block_data]).reshape(-1, 1)
-
-                # Perform hierarchical clustering to identify columns
-                Z = linkage(x_positions, method='ward')
-                column_labels = fcluster(Z, t=50, criterion='distance')  # Adjust distance threshold as needed
-
-                # Group blocks by detected column
-                column_dict = {}
-                for label, block in zip(column_labels, block_data):
-                    if label not in column_dict:
-                        column_dict[label] = []
-                    column_dict[label].append(block)
-
-                # Sort blocks within each column (top to bottom)
-                for col in column_dict:
-                    column_dict[col] = sorted(column_dict[col], key=lambda b: b[1])
-
-                # Order columns from left to right (based on mean x-coordinates)
-                sorted_columns = sorted(column_dict.keys(), key=lambda c: np.mean([b[0] for b in column_dict[c]]))
-
-                # Flatten text output in proper order
-                ordered_text = []
-                for col in sorted_columns:
-                    ordered_text.extend([b[4] for b in column_dict[col]])
-
-                extracted_text.append(f"--- Page {page_num + 1} ---\n" + "\n".join(ordered_text))
-
-            # Merge all pages' text into a single string
-            text_data = "\n\n".join(extracted_text)
-
-            # Manually create file metadata and upload extracted text
-            file_metadata = {'title': file_name}
-            if folder_id:
-                file_metadata['parents'] = [{'id': folder_id}]
+            text_data = extract_text(pdf, y_tolerance=y_tolerance)
 
             # Check if file already exists
             query = f"title = '{file_name}' and mimeType != 'application/vnd.google-apps.folder'"
             if folder_id:
                 query += f" and '{folder_id}' in parents"
-            existing_files = self.drive.ListFile({'q': query}).GetList()
+            existing_files = self._list(query)
 
-            # Delete existing files with the same name
+            # Delete existing files with the same name, in a single batch request
             for f in existing_files:
                 logging.info(f"Deleting existing file: {f['title']}")
-                f.Delete()
+            self._batch_delete([f['id'] for f in existing_files])
 
-            # Create and upload the file
-            file = self.drive.CreateFile(file_metadata)
-            file.SetContentString(text_data)
-            file.Upload()
+            # Upload the extracted text
+            media = self._build_media(io.BytesIO(text_data.encode('utf-8')), 'text/plain', chunk_size_mb)
+            file = self._insert_file(file_name, folder_id, media)
 
             logging.info(f"File '{file_name}' uploaded successfully to folder ID '{folder_id}', replacing any previous versions.")
             return file['id']
 
         except Exception as e:
-            logging.error(f"Error extracting text from '{pdf_path}': {e}")
+            logging.error(f"Error extracting text for '{file_name}': {e}")
             raise
         
     def delete_user_folder_if_exists(self, parent_folder_id: str, user_folder_name: str) -> None:
@@ -697,28 +891,208 @@ class GoogleDriveFolder:
         try:
             # List all folders under the parent
             file_list = self.drive.ListFile({
-                'q': f"'{parent_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+                'q': f"'{parent_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false",
+                'fields': LIST_FIELDS
             }).GetList()
 
             # Find the folder with the matching name
             for folder in file_list:
                 if folder['title'] == user_folder_name:
-                    # If found, list all its contents and delete them
-                    contents = self.drive.ListFile({
-                        'q': f"'{folder['id']}' in parents and trashed=false"
-                    }).GetList()
-
-                    for item in contents:
-                        item.Delete()
-
-                    # Delete the folder itself
-                    folder.Delete()
+                    # If found, delete it: Drive deletes a folder's contents along with it
+                    self._batch_delete([folder['id']])
+                    self._forget_folders([folder['id']])
                     logging.info(f"Deleted existing folder '{user_folder_name}' and its contents.")
                     return
 
         except Exception as e:
             logging.error(f"Error while cleaning up folder '{user_folder_name}': {e}")
 
+    def find_folders(self, folder_name: str, parent_folder_ids: list[str]) -> dict[str, str]:
+        """
+        Looks up folders with the given name under any of the given parent folders in a single request.
+
+        :param folder_name: The name of the folder to look for.
+        :param parent_folder_ids: The IDs of the parent folders to search in.
+        :return: A dict mapping each parent folder ID to the ID of the matching folder found in it.
+        :raises: The lookup error (an empty result would be mistaken for "no folders" and create duplicates).
+        """
+        try:
+            parents = " or ".join(f"'{parent_id}' in parents" for parent_id in parent_folder_ids)
+            query = f"title = '{folder_name}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false and ({parents})"
+            folder_list = self.drive.ListFile({'q': query, 'fields': 'items(id,parents(id))'}).GetList()
+
+            found = {}
+            for folder in folder_list:
+                for parent in folder['parents']:
+                    if parent['id'] in parent_folder_ids:
+                        found.setdefault(parent['id'], folder['id'])
+            return found
+
+        except Exception as e:
+            logging.error(f"Error looking up folder '{folder_name}': {e}")
+            raise
+
+    def batch_delete_and_create(self, deletes: list[str], creates: list[tuple[str, str]]) -> dict[tuple[str, str], str]:
+        """
+        Deletes files/folders and creates folders in a single batch HTTP request.
+        Deleting a folder also deletes its contents.
+
+        :param deletes: IDs of the files or folders to delete.
+        :param creates: (folder_name, parent_folder_id) pairs of the folders to create.
+        :return: A dict mapping each created (folder_name, parent_folder_id) pair to the new folder's ID.
+        :raises: The first error reported for any of the deletes or creates (once the whole batch has run).
+        """
+        created = {}
+        errors = []
+        if not deletes and not creates:
+            return created
+
+        def callback(request_id, response, exception):
+            if exception is not None and request_id.startswith("delete:") and is_not_found(exception):
+                return  # Already gone
+            if exception is not None:
+                logging.error(f"Batch request '{request_id}' failed: {exception}")
+                errors.append(exception)
+            elif request_id.startswith("create:"):
+                created[creates[int(request_id.split(":")[1])]] = response['id']
+
+        service = self._service()
+        batch = service.new_batch_http_request(callback=callback)
+
+        for i, file_id in enumerate(deletes):
+            batch.add(service.files().delete(fileId=file_id, supportsAllDrives=True), request_id=f"delete:{i}")
+
+        for i, (folder_name, parent_folder_id) in enumerate(creates):
+            folder_metadata = {
+                'title': folder_name,
+                'mimeType': 'application/vnd.google-apps.folder',
+                'parents': [{'id': parent_folder_id}]
+            }
+            batch.add(
+                service.files().insert(body=folder_metadata, supportsAllDrives=True, fields='id'),
+                request_id=f"create:{i}"
+            )
+
+        batch.execute(http=self._http())
+        self._forget_folders(deletes)
+        if errors:
+            raise errors[0]
+
+        logging.info(f"Batch request done: {len(deletes)} deleted, {len(created)}/{len(creates)} folders created.")
+        return created
+
+
+def open_pdf(pdf) -> "pymupdf.Document":
+    """
+    Opens a PDF from a file path, raw bytes or a binary file-like object (read from the start).
+    :param pdf: The PDF source.
+    :return: The opened pymupdf Document.
+    """
+    import pymupdf  # Imported lazily: only needed when a PDF is processed
+
+    if isinstance(pdf, str):
+        return pymupdf.open(pdf)
+    if hasattr(pdf, "read"):
+        pdf.seek(0)
+        pdf = pdf.read()
+    return pymupdf.open(stream=pdf, filetype="pdf")
+
+def md5_hexdigest(source) -> str:
+    """
+    Computes the MD5 of a local file or of a binary file-like object (left rewound), as reported by Drive's md5Checksum.
+    :param source: A local file path or a binary file-like object.
+    :return: The hex digest.
+    """
+    if isinstance(source, io.BytesIO):
+        # getvalue() shares the buffer's bytes instead of copying them
+        return hashlib.md5(source.getvalue()).hexdigest()
+
+    digest = hashlib.md5()
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    source.seek(0)
+    for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+def _process_page(doc, page_num: int) -> str | None:
+    """
+    Extracts the text of one page, ordering text blocks by column (left to right)
+    and then top to bottom.
+    :param doc: The opened pymupdf Document.
+    :param page_num: The zero-based page index.
+    :return: The page text with its "--- Page N ---" header, or None for an empty page.
+    """
+    page = doc[page_num]
+    text_blocks = page.get_text("blocks")  # Default block flags already leave out image content
+
+    if not text_blocks:
+        return None  # Skip empty pages
+
+    # Coordinates as a structured array (x0 and y0 are all the ordering needs)
+    coords = np.fromiter(((b[0], b[1]) for b in text_blocks), dtype=[('x0', 'f4'), ('y0', 'f8')], count=len(text_blocks))
+
+    # Detect columns: sort the x-coordinates once and start a new column
+    # wherever the gap to the previous block exceeds 50 units (adjust as needed)
+    order = np.argsort(coords['x0'], kind='stable')
+    gaps = np.diff(coords['x0'][order]) > 50
+    column_labels = np.empty(len(coords), dtype=np.intp)
+    column_labels[order] = np.concatenate(([0], np.cumsum(gaps)))
+
+    # Columns are numbered left to right, so a single sort yields column order, then top to bottom
+    ordered_text = [text_blocks[i][4] for i in np.lexsort((coords['y0'], column_labels))]
+
+    return f"--- Page {page_num + 1} ---\n" + "\n".join(ordered_text)
+
+def extract_text(pdf, y_tolerance=5) -> str:
+    """
+    Extracts the text of a PDF, page by page (see _process_page), ordering text blocks by column
+    (left to right) and then top to bottom. Pages are processed in-process, one after another:
+    PyMuPDF is neither thread-safe nor releases the GIL, and a page takes only milliseconds.
+    :param pdf: Path to the PDF file, its raw bytes or a binary file-like object.
+    :param y_tolerance: Y-axis tolerance for grouping text lines.
+    :return: The extracted text.
+    """
+    # The document is closed as soon as it is no longer needed, even if a page fails
+    with _PYMUPDF_LOCK, open_pdf(pdf) as doc:
+        pages = [_process_page(doc, page_num) for page_num in range(len(doc))]
+
+    # Merge all pages' text into a single string
+    return "\n\n".join(text for text in pages if text is not None)
+
+def get_retry_after(error: Exception) -> float | None:
+    """
+    Returns the delay (in seconds) requested by the server through a Retry-After header.
+    :param error: The exception raised by a Drive call (googleapiclient HttpError or pydrive2 ApiRequestError).
+    :return: The delay in seconds, or None if the error carries no Retry-After header.
+    """
+    if isinstance(error, ApiRequestError) and error.args:
+        error = error.args[0]  # pydrive2 wraps the original HttpError
+
+    resp = getattr(error, "resp", None)
+    if resp is None:
+        return None
+
+    try:
+        return float(resp.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def is_not_found(error: Exception) -> bool:
+    """
+    Tells whether a Drive call failed because the file does not exist (HTTP 404),
+    e.g. deleting something that is already gone.
+    """
+    if isinstance(error, ApiRequestError) and error.args:
+        error = error.args[0]  # pydrive2 wraps the original HttpError
+    return getattr(getattr(error, "resp", None), "status", None) == 404
+
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+')
 
 def is_valid_email(email: str) -> bool:
     """
@@ -726,31 +1100,53 @@ def is_valid_email(email: str) -> bool:
     :param email: The email address to validate.
     :return: True if valid, False otherwise.
     """
-    email_regex = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
-    return bool(re.match(email_regex, email))
+    return _EMAIL_RE.fullmatch(email) is not None
 
 def is_valid_password(password: str, real: str) -> bool:
     """
-    Validates possword.
+    Validates possword (constant-time comparison).
     """
-    return password == real
-
-def update_observation(df: pd.DataFrame, file_name: str, email: str) -> tuple[str, pd.DataFrame]:
-    # Check if email exists in the dataframe
-    existing_record = df[df['email'] == email]
+    return hmac.compare_digest(password.encode(), real.encode())
 
-    if not existing_record.empty and existing_record['status'].iloc[0] == "Ready":
-        # If the email exists and status is 'Listo', deny any changes
-        return "Negado: Servicio ya provisto.", df
-    
-    if not existing_record.empty:
-        # If the email exists and status is not 'Listo', overwrite with 'Process'
-        df.loc[df['email'] == email, ['file_name', 'status']] = file_name, "Process"
-        return "Aceptado: Sobre-Escritura.", df
+def build_email_index(df: pd.DataFrame) -> dict[str, list]:
+    """
+    Maps each email to the index labels of its rows (in order; an email may appear more than once,
+    see update_observations_bulk), for O(1) lookups.
+    :param df: Observations DataFrame with an 'email' column.
+    :return: Dictionary email -> list of row index labels.
+    """
+    email_index = {}
+    for label, email in zip(df.index, df['email']):
+        email_index.setdefault(email, []).append(label)
+    return email_index
+
+def update_observation(df: pd.DataFrame, file_name: str, email: str, email_index: dict[str, list] = None) -> tuple[str, pd.DataFrame]:
+    if email_index is not None:
+        # Look up and write the user's rows through email_index (see build_email_index), without scanning
+        rows = email_index.get(email)
+        if rows:
+            if df.at[rows[0], 'status'] == "Ready":
+                return "Negado: Servicio ya provisto.", df
+            df.loc[rows, ['file_name', 'status']] = file_name, "Process"
+            return "Aceptado: Sobre-Escritura.", df
+    else:
+        # Check if email exists in the dataframe
+        existing_record = df[df['email'] == email]
+
+        if not existing_record.empty and existing_record['status'].iloc[0] == "Ready":
+            # If the email exists and status is 'Listo', deny any changes
+            return "Negado: Servicio ya provisto.", df
+
+        if not existing_record.empty:
+            # If the email exists and status is not 'Listo', overwrite with 'Process'
+            df.loc[existing_record.index, ['file_name', 'status']] = file_name, "Process"
+            return "Aceptado: Sobre-Escritura.", df
 
     # If email doesn't exist, create a new observation with 'Process'
     new_data = pd.DataFrame([[file_name, email, "Process", "Pending"]], columns=['file_name', 'email', 'status', 'sent_email'])
     df = pd.concat([df, new_data], ignore_index=True)
+    if email_index is not None:
+        email_index[email] = [df.index[-1]]
     return "Aceptado: Nuevo Registro.", df
 
 